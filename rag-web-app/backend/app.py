@@ -1,11 +1,21 @@
 import os
-import re
+import json
+import uuid
+import socket
+import string
+from typing import Dict
+from urllib.parse import urlparse
+import aiofiles
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from rag import ingest_document, answer_question, ingest_url, get_session_technical_info
+from rag import (
+    aingest_document, answer_question, prepare_answer, stream_answer,
+    aingest_url, get_session_technical_info, load_vectordb, run_io,
+    BlockedURLError, is_blocked_host
+)
 
 load_dotenv()
 
@@ -38,12 +48,32 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
-sessions = {}
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+
+class _SafeFilenameTable(dict):
+    # str.translate table: keeps [a-zA-Z0-9._-], maps every other character to '_'
+    def __missing__(self, key):
+        return "_"
+
+
+_SAFE_FILENAME_TABLE = _SafeFilenameTable(
+    (ord(c), c) for c in string.ascii_letters + string.digits + "._-"
+)
+
+
+def _is_valid_session_id(session_id: str) -> bool:
+    # Security: Session IDs are UUIDs and double as directory names on disk
+    try:
+        return str(uuid.UUID(session_id)) == session_id
+    except ValueError:
+        return False
 
 
 class QuestionRequest(BaseModel):
     session_id: str
     question: str
+    include_preview: bool = False
 
 
 class URLRequest(BaseModel):
@@ -57,24 +87,29 @@ async def upload_pdf(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="No filename provided")
     
     # Security: Sanitize filename
-    safe_filename = re.sub(r'[^a-zA-Z0-9._-]', '_', file.filename)
+    safe_filename = file.filename.translate(_SAFE_FILENAME_TABLE)
     if not safe_filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
     
     # Security: File size limit (10MB)
     MAX_FILE_SIZE = 10 * 1024 * 1024
-    file_content = await file.read()
-    if len(file_content) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail=f"File size exceeds {MAX_FILE_SIZE / (1024*1024)}MB limit")
     
     file_path = os.path.join(UPLOADS_DIR, safe_filename)
     
+    # Stream to disk in 1MB chunks, enforcing the size limit as we go
+    total_size = 0
+    async with aiofiles.open(file_path, "wb") as f:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            total_size += len(chunk)
+            if total_size > MAX_FILE_SIZE:
+                break
+            await f.write(chunk)
+    if total_size > MAX_FILE_SIZE:
+        os.remove(file_path)
+        raise HTTPException(status_code=400, detail=f"File size exceeds {MAX_FILE_SIZE / (1024*1024)}MB limit")
+    
     try:
-        with open(file_path, "wb") as f:
-            f.write(file_content)
-
-        session_id, vectordb, technical_info = ingest_document(file_path)
-        sessions[session_id] = vectordb
+        session_id, vectordb, technical_info = await aingest_document(file_path)
 
         return {
             "session_id": session_id,
@@ -91,36 +126,92 @@ async def upload_pdf(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Error processing file: {error_msg}")
 
 
-@app.post("/ask")
-async def ask(req: QuestionRequest):
+def _validate_question(req: QuestionRequest):
     # Security: Validate input
     if not req.session_id or not req.session_id.strip():
         raise HTTPException(status_code=400, detail="Session ID is required")
     
+    if not _is_valid_session_id(req.session_id):
+        raise HTTPException(status_code=404, detail="Invalid session")
+    
     if not req.question or not req.question.strip():
         raise HTTPException(status_code=400, detail="Question is required")
     
     # Security: Limit question length
     if len(req.question) > 1000:
         raise HTTPException(status_code=400, detail="Question too long (max 1000 characters)")
-    
-    vectordb = sessions.get(req.session_id)
+
+
+async def _session_vectordb(session_id: str):
+    # Sessions are reopened lazily from disk (rag keeps an LRU of open handles)
+    vectordb = await run_io(load_vectordb, session_id)
     if not vectordb:
         raise HTTPException(status_code=404, detail="Invalid session")
+    return vectordb
+
+
+def _question_error(e: Exception) -> HTTPException:
+    # Security: Don't expose internal error details
+    error_msg = str(e)
+    if "OPENAI_API_KEY" in error_msg.upper() or "API" in error_msg.upper():
+        return HTTPException(status_code=500, detail="Error processing question. Please try again.")
+    return HTTPException(status_code=500, detail=f"Error processing question: {error_msg}")
+
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/ask")
+async def ask(req: QuestionRequest):
+    _validate_question(req)
     
+    vectordb = await _session_vectordb(req.session_id)
     try:
-        answer, metadata, technical_info = answer_question(vectordb, req.question)
-        return {
-            "answer": answer,
-            "metadata": metadata,
-            "technical_info": technical_info
-        }
+        answer, metadata, technical_info = await answer_question(
+            vectordb, req.question, session_id=req.session_id,
+            include_preview=req.include_preview
+        )
     except Exception as e:
-        # Security: Don't expose internal error details
-        error_msg = str(e)
-        if "OPENAI_API_KEY" in error_msg.upper() or "API" in error_msg.upper():
-            raise HTTPException(status_code=500, detail="Error processing question. Please try again.")
-        raise HTTPException(status_code=500, detail=f"Error processing question: {error_msg}")
+        raise _question_error(e)
+    
+    return {
+        "answer": answer,
+        "metadata": metadata,
+        "technical_info": technical_info
+    }
+
+
+@app.post("/ask/stream")
+async def ask_stream(req: QuestionRequest):
+    """
+    Stream the answer as Server-Sent Events.
+    
+    Sends a "metadata" event (metadata + technical_info) first, then one "token"
+    event per answer fragment, then "done" (or "error" if generation fails).
+    """
+    _validate_question(req)
+    
+    vectordb = await _session_vectordb(req.session_id)
+    try:
+        chain_input, metadata, technical_info = await prepare_answer(
+            vectordb, req.question, session_id=req.session_id,
+            include_preview=req.include_preview
+        )
+    except Exception as e:
+        raise _question_error(e)
+    
+    async def event_stream():
+        yield _sse("metadata", {"metadata": metadata, "technical_info": technical_info})
+        try:
+            async for token in stream_answer(chain_input):
+                yield _sse("token", {"token": token})
+        except Exception as e:
+            yield _sse("error", {"detail": _question_error(e).detail})
+            return
+        yield _sse("done", {})
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 
 @app.post("/process-url")
@@ -128,9 +219,6 @@ async def process_url(req: URLRequest):
     """
     Process a web URL, generate summary, and create a session for RAG queries.
     """
-    import re
-    from urllib.parse import urlparse
-    
     # Security: Validate URL
     if not req.url or not req.url.strip():
         raise HTTPException(status_code=400, detail="URL is required")
@@ -149,9 +237,12 @@ async def process_url(req: URLRequest):
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid URL format")
     
-    # Security: Block local/private IPs (optional but recommended)
-    blocked_domains = ['localhost', '127.0.0.1', '0.0.0.0', '192.168.', '10.', '172.']
-    if any(blocked in url.lower() for blocked in blocked_domains):
+    # Security: Block local/private hosts (checked on the hostname, not the whole URL)
+    try:
+        blocked = await is_blocked_host(parsed.hostname or "")
+    except (socket.gaierror, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid URL format")
+    if blocked:
         raise HTTPException(status_code=400, detail="Local/private URLs are not allowed")
     
     # Security: URL length limit
@@ -159,8 +250,7 @@ async def process_url(req: URLRequest):
         raise HTTPException(status_code=400, detail="URL too long (max 2048 characters)")
     
     try:
-        session_id, vectordb, summary, technical_info = ingest_url(url)
-        sessions[session_id] = vectordb
+        session_id, vectordb, summary, technical_info = await aingest_url(url)
         
         return {
             "session_id": session_id,
@@ -168,6 +258,9 @@ async def process_url(req: URLRequest):
             "url": url,
             "technical_info": technical_info
         }
+    except BlockedURLError:
+        # A redirect led to a local/private host
+        raise HTTPException(status_code=400, detail="Local/private URLs are not allowed")
     except Exception as e:
         error_msg = str(e)
         # Provide user-friendly error messages
@@ -182,7 +275,9 @@ async def process_url(req: URLRequest):
 @app.get("/session/{session_id}/technical")
 async def get_technical_info(session_id: str):
     """Get technical information about a session"""
-    technical_info = get_session_technical_info(session_id)
+    if not _is_valid_session_id(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    technical_info = await run_io(get_session_technical_info, session_id)
     if not technical_info:
         raise HTTPException(status_code=404, detail="Session not found")
     return technical_info
@@ -1,17 +1,47 @@
 import os
+import re
+import json
 import uuid
-from typing import List, Dict, Tuple, Optional, Any
+import asyncio
+import hashlib
+import ipaddress
+import logging
+import queue
+import shutil
+import socket
+import threading
+import time
+import weakref
+import diskcache
+import httpx
+import numpy as np
+import openai
+import tiktoken
+import trafilatura
+from bs4 import BeautifulSoup
+from chromadb.api.client import SharedSystemClient
+from cachetools import TLRUCache
+from pypdf import PdfReader
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from concurrent.futures import Executor, ThreadPoolExecutor
+from collections import OrderedDict
+from functools import lru_cache, partial, wraps
+from typing import List, Dict, Tuple, Optional, Any, AsyncIterator, Callable, TypeVar
 from pathlib import Path
 from dotenv import load_dotenv
 
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_community.document_loaders import PyPDFLoader, WebBaseLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain.prompts import PromptTemplate
+from langchain.schema import Document
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain_core.stores import ByteStore
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Security: Verify OpenAI API key is set
 if not os.getenv("OPENAI_API_KEY"):
     raise ValueError("OPENAI_API_KEY environment variable is required. Set it in Railway environment variables.")
@@ -25,11 +55,151 @@ UPLOAD_DIR.mkdir(exist_ok=True, parents=True)
 VECDB_DIR.mkdir(exist_ok=True, parents=True)
 
 # Initialize embeddings with specific model
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+# chunk_size is the number of texts sent per embeddings request
+embeddings = OpenAIEmbeddings(
+    model="text-embedding-3-small",
+    chunk_size=2048,
+    max_retries=5,
+    request_timeout=60
+)
 
-# Initialize prompt template
-prompt = PromptTemplate(
-    template="""
+class _DiskCacheByteStore(ByteStore):
+    """LangChain ByteStore over a diskcache.Cache (size-limited, evicts on write)."""
+
+    def __init__(self, cache: diskcache.Cache):
+        self._cache = cache
+
+    def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        return [self._cache.get(key) for key in keys]
+
+    def mset(self, key_value_pairs: List[Tuple[str, bytes]]) -> None:
+        with self._cache.transact():
+            for key, value in key_value_pairs:
+                self._cache.set(key, value)
+
+    def mdelete(self, keys: List[str]) -> None:
+        for key in keys:
+            self._cache.delete(key)
+
+    def yield_keys(self, prefix: Optional[str] = None) -> Any:
+        for key in self._cache.iterkeys():
+            if prefix is None or key.startswith(prefix):
+                yield key
+
+
+# Persistent embedding cache (keyed by hash of text + model namespace), bounded
+# on disk with least-recently-used eviction
+# Re-ingesting the same content skips the OpenAI round trip entirely
+EMBED_CACHE_DIR = VECDB_DIR / "embcache"
+EMBED_CACHE_SIZE_LIMIT = 1 << 30  # bytes
+# Remove a cache left by the former unbounded LocalFileStore (one file per chunk)
+if EMBED_CACHE_DIR.exists() and not (EMBED_CACHE_DIR / "cache.db").exists():
+    shutil.rmtree(EMBED_CACHE_DIR)
+cached_embeddings = CacheBackedEmbeddings.from_bytes_store(
+    embeddings,
+    _DiskCacheByteStore(diskcache.Cache(
+        str(EMBED_CACHE_DIR),
+        size_limit=EMBED_CACHE_SIZE_LIMIT,
+        eviction_policy="least-recently-used"
+    )),
+    namespace="text-embedding-3-small"
+)
+
+# Answer cache: hot entries in memory, warm entries on disk, both keyed by
+# (session_id, normalized question, retrieval settings); generated answers are
+# also stored under (session_id, retrieved chunk ids, question).
+# Hot entries hold (value, expire_at) and keep the expiry they were written with
+# on disk, so promoting an entry never extends its lifetime.
+ANSWER_CACHE_TTL = 3600  # seconds
+ANSWER_CACHE_DIR = VECDB_DIR / "qcache"
+_ANSWER_CACHE_HOT: TLRUCache = TLRUCache(
+    maxsize=1024, ttu=lambda _key, entry, _now: entry[1], timer=time.time
+)
+_ANSWER_CACHE_DISK = diskcache.Cache(str(ANSWER_CACHE_DIR))
+
+# Number of chunks retrieved per question (before threshold filtering)
+RETRIEVAL_K = 10
+
+# Retrieved chunks whose character 5-gram Jaccard similarity with a better
+# match reaches this threshold are dropped before building the prompt
+DEDUP_SHINGLE_SIZE = 5
+DEDUP_JACCARD_THRESHOLD = 0.8
+
+# Chunking parameters (characters); one splitter instance is shared by both ingest paths
+# Separators are regexes: the sentence break is a lookbehind so the ". " stays at
+# the end of the preceding piece instead of starting the next chunk
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 200
+_SPLITTER = RecursiveCharacterTextSplitter(
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=CHUNK_OVERLAP,
+    separators=["\n\n", "\n", r"(?<=\. )", " ", ""],
+    is_separator_regex=True
+)
+
+# Ingestion embeds chunks in concurrent batches of at most this many texts (OpenAI's
+# per-request max) and this many tokens (below OpenAI's 300k per-request token limit)
+EMBED_BATCH_SIZE = 2048
+EMBED_BATCH_MAX_TOKENS = 250_000
+EMBED_CONCURRENCY = 16
+
+# PDF ingest pipeline: bounded chunk queue between the parser thread and the
+# embedder, and a smaller embedding batch so embedding starts while parsing continues
+PIPELINE_QUEUE_SIZE = 64
+PIPELINE_EMBED_BATCH_SIZE = 256
+_PIPELINE_DONE = object()
+
+# Chunks are written to ChromaDB in batches of at most this many records
+CHROMA_ADD_BATCH_SIZE = 5000
+
+# Dedicated worker pools so CPU-bound parsing/splitting doesn't compete with
+# network-bound work (OpenAI, web fetches, ChromaDB) for FastAPI's default pool
+CPU_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="rag-cpu")
+IO_POOL = ThreadPoolExecutor(max_workers=256, thread_name_prefix="rag-io")
+
+# Security: Local hostnames that URL ingestion must not fetch (IP addresses, literal
+# or resolved, are checked with ipaddress in is_blocked_host)
+_BLOCKED_HOST_RE = re.compile(r'(?i)^(?:.+\.)?localhost\.?$')
+
+# Pooled HTTP/2 clients for fetching web pages, one per event loop
+_HTTP_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+# Async OpenAI clients for ingest embedding, one per event loop (keeps the
+# connection pool warm across embedding batches)
+_OPENAI_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, openai.AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+# Matches http(s) URLs, capturing the host and the first 50 chars of the path (slash included)
+_URL_RE = re.compile(r'^https?://([^/?#]+)(/[^?#]{0,49})?')
+
+# Display names of Chroma distance functions (collection "hnsw:space")
+_DISTANCE_LABELS = {"cosine": "Cosine Distance", "ip": "Inner Product Distance", "l2": "L2 Distance"}
+
+# Chunk count per session, recorded at ingest (avoids a COUNT query on every question)
+_CHUNK_COUNTS: Dict[str, int] = {}
+
+# LRU of open Chroma handles, shared by ingestion, querying and session info.
+# Evicted sessions have their chromadb System stopped, which bounds open indexes.
+# The (reentrant) lock is held while opening, evicting or stopping a handle, so a
+# handle is never opened onto a System that is being stopped
+VECTORDB_CACHE_SIZE = 32
+_VDB_CACHE: "OrderedDict[str, Chroma]" = OrderedDict()
+_VDB_CACHE_LOCK = threading.RLock()
+
+# Per-session locks serializing retrieval on a session's Chroma handle; an entry
+# disappears as soon as no request holds its lock
+_SESSION_LOCKS: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+# Technical info written into each session directory at ingest
+SESSION_INFO_FILE = "info.json"
+
+# Directories inside VECDB_DIR that are not sessions
+_RESERVED_DIRS = {EMBED_CACHE_DIR.name, ANSWER_CACHE_DIR.name}
+
+
+# Question-answering prompt
+def _render_qa_prompt(context: str, question: str) -> str:
+    """Render the question-answering prompt (a plain f-string; the template is static)."""
+    return f"""
 Answer ONLY using the context below.
 Add the source filename (without path) after EACH sentence in [filename] format.
 Use only the filename, not the full path.
@@ -39,13 +209,23 @@ Context:
 
 Question:
 {question}
-""",
-    input_variables=["context", "question"]
-)
+"""
+
 
 # Initialize LLM
 llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
 
+# Answer cache keys include the models and the QA prompt, so answers cached
+# before a model or prompt change are not served after it
+_ANSWER_CACHE_NAMESPACE = hashlib.blake2b(
+    "\x1f".join([
+        llm.model_name,
+        embeddings.model,
+        _render_qa_prompt("{context}", "{question}")
+    ]).encode("utf-8"),
+    digest_size=8
+).hexdigest()
+
 # Summary prompt template
 summary_prompt = PromptTemplate(
     template="""
@@ -60,8 +240,480 @@ Provide a comprehensive summary:
     input_variables=["content"]
 )
 
+# Number of leading content characters sent to the LLM for URL summaries
+SUMMARY_INPUT_CHARS = 8000
 
-def ingest_document(file_path: str) -> Tuple[str, Chroma, Dict]:
+# Summary prompt template with source citations (used for URLs)
+summary_with_citation_prompt = PromptTemplate(
+    template="""
+Summarize the following web content in a clear and concise manner.
+Focus on the main points, key information, and important details.
+Include source citations in the format [Source: {url}] at the end of each major point.
+
+Content:
+{content}
+
+Provide a comprehensive summary with source citations:
+""",
+    input_variables=["content", "url"]
+)
+
+
+T = TypeVar("T")
+
+
+async def _run_in(pool: Executor, func: Callable[..., T], *args: Any) -> T:
+    """Run a blocking function in the given worker pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, partial(func, *args))
+
+
+async def run_cpu(func: Callable[..., T], *args: Any) -> T:
+    """Run CPU-bound work (PDF parsing, splitting) in CPU_POOL."""
+    return await _run_in(CPU_POOL, func, *args)
+
+
+async def run_io(func: Callable[..., T], *args: Any) -> T:
+    """Run blocking I/O (OpenAI, web fetches, ChromaDB) in IO_POOL."""
+    return await _run_in(IO_POOL, func, *args)
+
+
+def _session_lock(session_id: str) -> asyncio.Lock:
+    """Get the retrieval lock for a session, creating it on first use."""
+    lock = _SESSION_LOCKS.get(session_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _SESSION_LOCKS[session_id] = lock
+    return lock
+
+
+def _release_session_system(session_id: str):
+    """
+    Stop a session's chromadb System and drop it from chromadb's process-wide cache.
+    
+    chromadb keeps every System (SQLite database, loaded HNSW segments) in
+    SharedSystemClient._identifer_to_system, keyed by persist path, for the life
+    of the process, so dropping our own handle alone frees nothing.
+    """
+    system = SharedSystemClient._identifer_to_system.pop(str(VECDB_DIR / session_id), None)
+    if system is not None:
+        system.stop()
+
+
+def _cache_vectordb(session_id: str, vectordb: Chroma):
+    """
+    Insert a Chroma handle into the LRU, evicting the least recently used ones.
+    
+    Evicted sessions release their chromadb System (under _VDB_CACHE_LOCK) and
+    are reopened from disk on the next load_vectordb call. Sessions with a
+    retrieval in flight (a live session lock) are skipped, so the LRU can briefly
+    exceed its size.
+    """
+    with _VDB_CACHE_LOCK:
+        _VDB_CACHE[session_id] = vectordb
+        _VDB_CACHE.move_to_end(session_id)
+        while len(_VDB_CACHE) > VECTORDB_CACHE_SIZE:
+            idle_id = next(
+                (cached_id for cached_id in _VDB_CACHE
+                 if cached_id != session_id and cached_id not in _SESSION_LOCKS),
+                None
+            )
+            if idle_id is None:
+                break
+            del _VDB_CACHE[idle_id]
+            _release_session_system(idle_id)
+
+
+@lru_cache(maxsize=1024)
+def _embed_query(text: str) -> Tuple[float, ...]:
+    """
+    Embed a question, memoizing repeated questions in-process.
+    
+    Args:
+        text: Question text
+        
+    Returns:
+        Query embedding as an immutable tuple (safe to share from the cache)
+    """
+    return tuple(embeddings.embed_query(text))
+
+
+def _create_vectordb(
+    session_id: str,
+    texts: List[str],
+    metadatas: List[Dict],
+    vectors: List[List[float]]
+) -> Chroma:
+    """
+    Store precomputed chunk embeddings in a new session vector store.
+    
+    Args:
+        session_id: The session UUID (used as the persist directory name)
+        texts: Chunk texts
+        metadatas: Chunk metadata dicts
+        vectors: Chunk embeddings, aligned with texts
+        
+    Returns:
+        ChromaDB instance for the session
+    """
+    vectordb = Chroma(
+        persist_directory=str(VECDB_DIR / session_id),
+        embedding_function=cached_embeddings,
+        collection_metadata={"hnsw:space": "cosine"}
+    )
+    ids = [str(uuid.uuid4()) for _ in texts]
+    for start in range(0, len(texts), CHROMA_ADD_BATCH_SIZE):
+        end = start + CHROMA_ADD_BATCH_SIZE
+        vectordb._collection.add(
+            ids=ids[start:end],
+            embeddings=vectors[start:end],
+            documents=texts[start:end],
+            metadatas=metadatas[start:end]
+        )
+    _cache_vectordb(session_id, vectordb)
+    return vectordb
+
+
+@retry(
+    retry=retry_if_exception_type((openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)),
+    wait=wait_random_exponential(min=1, max=60),
+    stop=stop_after_attempt(6),
+    reraise=True
+)
+async def _embed_batch_async(client: openai.AsyncOpenAI, batch: List[str]) -> List[List[float]]:
+    """Embed one batch with the OpenAI API, retrying on rate limits and transient errors."""
+    response = await client.embeddings.create(model=embeddings.model, input=batch)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+def _openai_client() -> openai.AsyncOpenAI:
+    """Get the shared async OpenAI client for the running event loop (connections are loop-bound)."""
+    loop = asyncio.get_running_loop()
+    client = _OPENAI_CLIENTS.get(loop)
+    if client is None:
+        # Retries are handled by _embed_batch_async
+        client = openai.AsyncOpenAI(max_retries=0, timeout=60)
+        _OPENAI_CLIENTS[loop] = client
+    return client
+
+
+@lru_cache(maxsize=1)
+def _embedding_encoding() -> tiktoken.Encoding:
+    """Tokenizer used by the OpenAI text-embedding-3 models (loaded once)."""
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def _embedding_batches(texts: List[str]) -> List[List[str]]:
+    """
+    Split texts into embedding requests bounded by both input count and tokens.
+    
+    Args:
+        texts: Texts to embed
+        
+    Returns:
+        Consecutive batches of texts, in input order
+    """
+    token_counts = [len(tokens) for tokens in _embedding_encoding().encode_ordinary_batch(texts)]
+    batches: List[List[str]] = []
+    batch: List[str] = []
+    batch_tokens = 0
+    for text, n_tokens in zip(texts, token_counts):
+        if batch and (len(batch) >= EMBED_BATCH_SIZE or batch_tokens + n_tokens > EMBED_BATCH_MAX_TOKENS):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += n_tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def _embed_all_async(texts: List[str]) -> List[List[float]]:
+    """
+    Embed texts in concurrent API-sized batches, preserving input order.
+    
+    Args:
+        texts: Texts to embed
+        
+    Returns:
+        List of embeddings, aligned with texts
+    """
+    semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+    client = _openai_client()
+
+    async def _embed_batch(batch: List[str]) -> List[List[float]]:
+        async with semaphore:
+            return await _embed_batch_async(client, batch)
+
+    batches = await run_cpu(_embedding_batches, texts)
+    results = await asyncio.gather(*[_embed_batch(batch) for batch in batches])
+    return [vector for batch_vectors in results for vector in batch_vectors]
+
+
+async def _aembed_documents(texts: List[str]) -> List[List[float]]:
+    """
+    Embed texts, serving repeats from the on-disk embedding cache.
+    
+    Args:
+        texts: Texts to embed
+        
+    Returns:
+        List of embeddings, aligned with texts
+    """
+    store = cached_embeddings.document_embedding_store
+    vectors = await run_io(store.mget, texts)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        new_vectors = await _embed_all_async(missing_texts)
+        for i, vector in zip(missing, new_vectors):
+            vectors[i] = vector
+        await run_io(store.mset, list(zip(missing_texts, new_vectors)))
+    return vectors
+
+
+async def _abuild_vectordb(chunks: List[Any], session_id: str) -> Chroma:
+    """
+    Embed all chunks concurrently and store them in a new session vector store.
+    
+    Args:
+        chunks: Split LangChain documents
+        session_id: The session UUID (used as the persist directory name)
+        
+    Returns:
+        ChromaDB instance for the session
+    """
+    texts = [chunk.page_content for chunk in chunks]
+    metadatas = [chunk.metadata for chunk in chunks]
+    vectors = await _aembed_documents(texts)
+    # A store write can't be interrupted once its thread starts; on cancellation,
+    # wait for it to finish so the caller can delete what it wrote
+    write = asyncio.ensure_future(run_io(_create_vectordb, session_id, texts, metadatas, vectors))
+    try:
+        return await asyncio.shield(write)
+    except asyncio.CancelledError:
+        await asyncio.wait([write])
+        raise
+
+
+def _produce_pdf_chunks(file_path: str, out: "queue.Queue[Any]", stop: threading.Event):
+    """
+    Extract a PDF page by page with pypdf and push each page's chunks onto a queue.
+    
+    Splitting per page gives the same chunks as splitting the page list at once
+    (the splitter handles each Document independently). Ends with _PIPELINE_DONE;
+    an extraction error is pushed as the exception object before it.
+    
+    Args:
+        file_path: Path to the PDF file
+        out: Bounded queue consumed by _apipeline_pdf
+        stop: Set by the consumer when it gives up; production ends at the next chunk
+    """
+    # Same text and metadata as PyPDFLoader, one page at a time
+    try:
+        reader = PdfReader(file_path)
+        for i, page in enumerate(reader.pages):
+            page_doc = Document(page_content=page.extract_text(), metadata={"source": file_path, "page": i})
+            for chunk in _SPLITTER.split_documents([page_doc]):
+                if stop.is_set():
+                    return
+                out.put(chunk)
+    except Exception as e:
+        out.put(e)
+    finally:
+        out.put(_PIPELINE_DONE)
+
+
+def _drain(q: "queue.Queue[Any]"):
+    """Discard everything currently in a queue (unblocks a producer waiting on put)."""
+    while True:
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            return
+
+
+async def _apipeline_pdf(file_path: str) -> Tuple[List[Document], List[List[float]]]:
+    """
+    Parse, split and embed a PDF as a pipeline.
+    
+    An IO_POOL thread produces chunks page by page while the event loop groups
+    them into batches and starts embedding each batch as soon as it fills, so
+    PDF parsing overlaps with the network-bound embedding calls. The bounded
+    queue only keeps the parser from running far ahead of the consumer; every
+    chunk is still kept for the vector store write.
+    
+    The producer spends most of its life blocked on the queue, so it runs on
+    IO_POOL: on CPU_POOL it would hold a worker that the embedding path needs
+    for token counting (run_cpu(_embedding_batches)), and with a single CPU
+    worker the pipeline would deadlock.
+    
+    If the consumer fails or is cancelled, pending embedding tasks are cancelled
+    and the producer is told to stop and unblocked, so it frees its worker.
+    
+    Args:
+        file_path: Path to the PDF file
+        
+    Returns:
+        Tuple of (chunks, vectors), aligned
+    """
+    chunk_queue: "queue.Queue[Any]" = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    stop = threading.Event()
+    producer = asyncio.ensure_future(run_io(_produce_pdf_chunks, file_path, chunk_queue, stop))
+    semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+    async def _embed_batch(batch: List[str]) -> List[List[float]]:
+        async with semaphore:
+            return await _aembed_documents(batch)
+
+    chunks: List[Document] = []
+    embed_tasks = []
+    batch: List[str] = []
+    done = False
+    try:
+        while not done:
+            # Block (off the loop) for the next chunk, then drain whatever else is ready
+            items = [await run_io(chunk_queue.get)]
+            while True:
+                try:
+                    items.append(chunk_queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            for item in items:
+                if item is _PIPELINE_DONE:
+                    done = True
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    chunks.append(item)
+                    batch.append(item.page_content)
+                    if len(batch) >= PIPELINE_EMBED_BATCH_SIZE:
+                        embed_tasks.append(asyncio.ensure_future(_embed_batch(batch)))
+                        batch = []
+        
+        if batch:
+            embed_tasks.append(asyncio.ensure_future(_embed_batch(batch)))
+        await producer
+        results = await asyncio.gather(*embed_tasks)
+    finally:
+        # Stop the producer first, then make room in the queue so a blocked put returns
+        stop.set()
+        _drain(chunk_queue)
+        for task in embed_tasks:
+            task.cancel()
+        # Retrieve every task's outcome so failures aren't reported as never retrieved
+        await asyncio.gather(*embed_tasks, return_exceptions=True)
+    return chunks, [vector for batch_vectors in results for vector in batch_vectors]
+
+
+class BlockedURLError(Exception):
+    """Raised when a URL, or a redirect it leads to, points at a local/private host."""
+
+
+def _is_blocked_ip(ip: str) -> bool:
+    """Check an IP address string against private/loopback/link-local/unspecified/reserved ranges."""
+    # Drop any IPv6 zone index ("fe80::1%eth0") before parsing
+    address = ipaddress.ip_address(ip.split("%", 1)[0])
+    return (
+        address.is_private or address.is_loopback or address.is_link_local
+        or address.is_unspecified or address.is_reserved
+    )
+
+
+async def is_blocked_host(hostname: str) -> bool:
+    """
+    Check whether a URL host is local/private (by name, IP literal or resolved address).
+    
+    Raises:
+        socket.gaierror: The hostname does not resolve
+        UnicodeError: The hostname is not valid IDNA (e.g. a label over 63 characters)
+    """
+    if _BLOCKED_HOST_RE.match(hostname):
+        return True
+    try:
+        return _is_blocked_ip(hostname)
+    except ValueError:
+        pass
+    # Hostname: block it if any address it resolves to is local/private
+    infos = await asyncio.get_running_loop().getaddrinfo(hostname, None)
+    return any(_is_blocked_ip(info[4][0]) for info in infos)
+
+
+async def _check_request_host(request: httpx.Request):
+    """httpx request hook: refuse every hop, including redirects, to a local/private host."""
+    try:
+        blocked = await is_blocked_host(request.url.host)
+    except (socket.gaierror, UnicodeError):
+        # Let httpx fail the request with its own connection error
+        return
+    if blocked:
+        raise BlockedURLError(f"Local/private URLs are not allowed: {request.url.host}")
+
+
+def _http_client() -> httpx.AsyncClient:
+    """Get the pooled HTTP client for the running event loop (connections are loop-bound)."""
+    loop = asyncio.get_running_loop()
+    client = _HTTP_CLIENTS.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            http2=True,
+            timeout=15,
+            follow_redirects=True,
+            headers={"User-Agent": "RAG/1.0"},
+            # Redirects are followed, so every hop is checked, not just the first URL
+            event_hooks={"request": [_check_request_host]},
+            limits=httpx.Limits(max_keepalive_connections=100)
+        )
+        _HTTP_CLIENTS[loop] = client
+    return client
+
+
+def _extract_main_text(html: str) -> str:
+    """
+    Extract the main readable text from an HTML page.
+    
+    Uses trafilatura's main-content extraction, falling back to all page text.
+    """
+    return trafilatura.extract(html) or BeautifulSoup(html, "lxml").get_text(" ", strip=True)
+
+
+async def _load_url(url: str) -> List[Document]:
+    """
+    Fetch a web page and extract its text.
+    
+    Args:
+        url: Web URL to fetch
+        
+    Returns:
+        List with one Document (source metadata set to the URL), or empty if no text
+    """
+    try:
+        response = await _http_client().get(url)
+        response.raise_for_status()
+    except httpx.TimeoutException:
+        raise Exception(f"Timeout fetching {url}")
+    except httpx.TransportError as e:
+        raise Exception(f"Connection error fetching {url}: {e}")
+    
+    text = await run_cpu(_extract_main_text, response.text)
+    if not text.strip():
+        return []
+    return [Document(page_content=text, metadata={"source": url})]
+
+
+def _save_session_info(session_id: str, technical_info: Dict):
+    """
+    Persist a session's ingest-time technical info next to its vector store.
+    
+    Args:
+        session_id: The session UUID
+        technical_info: Technical info returned by ingestion
+    """
+    (VECDB_DIR / session_id / SESSION_INFO_FILE).write_text(json.dumps(technical_info))
+
+
+async def aingest_document(file_path: str) -> Tuple[str, Chroma, Dict]:
     """
     Process PDF and create a session-based vector store.
     
@@ -71,34 +723,31 @@ def ingest_document(file_path: str) -> Tuple[str, Chroma, Dict]:
     Returns:
         Tuple of (session_id, vectordb, technical_info)
     """
-    loader = PyPDFLoader(file_path)
-    docs = loader.load()
+    # Parse, split and embed as one pipeline
+    chunks, vectors = await _apipeline_pdf(file_path)
 
-    if not docs:
+    if not chunks:
         raise Exception("No text extracted from PDF")
-
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=800,
-        chunk_overlap=200
-    )
-    chunks = splitter.split_documents(docs)
     
     # Calculate total characters
     total_chars = sum(len(chunk.page_content) for chunk in chunks)
     avg_chunk_size = total_chars / len(chunks) if chunks else 0
 
     session_id = str(uuid.uuid4())
-    vectordb = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=str(VECDB_DIR / session_id)
+    vectordb = await run_io(
+        _create_vectordb,
+        session_id,
+        [chunk.page_content for chunk in chunks],
+        [chunk.metadata for chunk in chunks],
+        vectors
     )
+    _CHUNK_COUNTS[session_id] = len(chunks)
     
     # Technical information
     technical_info = {
         "num_chunks": len(chunks),
-        "chunk_size": 800,
-        "chunk_overlap": 200,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
         "total_characters": total_chars,
         "avg_chunk_size": round(avg_chunk_size, 2),
         "embedding_model": "text-embedding-3-small",
@@ -107,55 +756,62 @@ def ingest_document(file_path: str) -> Tuple[str, Chroma, Dict]:
         "source_type": "PDF",
         "source": Path(file_path).name
     }
+    await run_io(_save_session_info, session_id, technical_info)
 
     return session_id, vectordb, technical_info
 
 
-def _normalize_similarity_score(raw_score: float) -> float:
+def ingest_document(file_path: str) -> Tuple[str, Chroma, Dict]:
+    """
+    Synchronous wrapper around aingest_document (for use outside an event loop).
+    
+    Args:
+        file_path: Path to the PDF file
+        
+    Returns:
+        Tuple of (session_id, vectordb, technical_info)
+    """
+    return asyncio.run(aingest_document(file_path))
+
+
+def _distance_space(vectordb: Chroma) -> str:
+    """
+    Get the distance function of a session collection ("hnsw:space" metadata).
+    
+    Sessions created before cosine collections were introduced have no
+    "hnsw:space" entry and use Chroma's default, squared L2.
+    """
+    return (vectordb._collection.metadata or {}).get("hnsw:space", "l2")
+
+
+def _normalize_similarity_scores(distances: List[float], space: str = "l2") -> np.ndarray:
     """
-    Normalize raw distance/similarity score from ChromaDB to a 0-1 similarity score.
+    Normalize ChromaDB distances to 0-1 similarity scores (the cosine similarity, clipped).
     
-    IMPORTANT: This is a SIMILARITY score (semantic similarity in embedding space),
-    NOT a RELEVANCE score (which would require understanding if the chunk answers the question).
+    IMPORTANT: These are SIMILARITY scores (semantic similarity in embedding space),
+    NOT RELEVANCE scores (which would require understanding if the chunk answers the question).
     
-    ChromaDB with OpenAI embeddings returns L2 distance:
-    - Lower values = more similar (0 = identical vectors)
-    - Higher values = less similar (~2.0 = opposite vectors)
+    OpenAI embeddings are unit-length, so both distance functions map to cosine similarity:
+    - "cosine" (and "ip"): distance = 1 - cos, so similarity = 1 - distance
+    - "l2" (squared L2): distance = 2 - 2*cos, so similarity = 1 - (distance / 2)
     
     Args:
-        raw_score: Raw score from ChromaDB (L2 distance or other metric)
+        distances: Distances from ChromaDB
+        space: The collection's distance function (see _distance_space)
         
     Returns:
-        Normalized similarity score (0.0 to 1.0, where 1.0 = most similar)
-    """
-    score_float = float(raw_score)
-    
-    # ChromaDB with OpenAI embeddings uses L2 distance on normalized vectors
-    # Typical range: 0 (identical) to ~2.0 (opposite)
-    if 0 <= score_float <= 2.0:
-        # L2 distance score (0 = perfect match, 2 = opposite)
-        # Convert to similarity: similarity = 1 - (distance / 2)
-        # Maps: 0 -> 1.0, 1.0 -> 0.5, 2.0 -> 0.0
-        normalized_score = 1.0 - (score_float / 2.0)
-    elif score_float < 0:
-        # Negative score, might be cosine similarity (-1 to 1)
-        # Normalize to 0-1: (score + 1) / 2
-        normalized_score = (score_float + 1) / 2
-    elif score_float > 2.0:
-        # Very large distance, use exponential decay
-        normalized_score = max(0.0, 1.0 / (1.0 + (score_float - 2.0)))
-    else:
-        # Fallback: assume it's already a similarity score (0-1)
-        normalized_score = score_float
-    
-    # Ensure final score is between 0 and 1
-    return max(0.0, min(1.0, normalized_score))
+        Array of normalized similarity scores (0.0 to 1.0, where 1.0 = most similar)
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    scale = 1.0 if space in ("cosine", "ip") else 0.5
+    return np.clip(1.0 - scale * distances, 0.0, 1.0)
 
 
 def _filter_by_similarity_threshold(
-    results: List[Tuple[Any, float]], 
-    threshold: Optional[float] = None
-) -> List[Tuple[Any, float]]:
+    results: List[Tuple[str, str, Dict, float]], 
+    threshold: Optional[float] = None,
+    space: str = "l2"
+) -> List[Tuple[str, str, Dict, float]]:
     """
     Filter retrieval results by similarity threshold.
     
@@ -163,23 +819,58 @@ def _filter_by_similarity_threshold(
     A SECOND filtering step (relevance-based) can be added later using LLM.
     
     Args:
-        results: List of (document, raw_score) tuples from similarity_search_with_score
+        results: List of (chunk_id, text, metadata, raw_score) tuples from the collection query
         threshold: Optional similarity threshold (0.0-1.0). If None, no filtering.
                    Recommended: 0.3-0.5 for production use.
+        space: The collection's distance function (see _distance_space)
         
     Returns:
-        Filtered list of (document, raw_score) tuples
+        Filtered list of (chunk_id, text, metadata, raw_score) tuples
     """
     if threshold is None:
         return results
     
-    filtered = []
-    for doc, raw_score in results:
-        similarity_score = _normalize_similarity_score(raw_score)
-        if similarity_score >= threshold:
-            filtered.append((doc, raw_score))
+    similarity_scores = _normalize_similarity_scores([raw_score for _, _, _, raw_score in results], space)
+    return [result for result, score in zip(results, similarity_scores) if score >= threshold]
+
+
+def _shingles(text: str, size: int = DEDUP_SHINGLE_SIZE) -> set:
+    """Character n-gram shingles of whitespace-normalized, lowercased text."""
+    normalized = " ".join(text.lower().split())
+    if len(normalized) <= size:
+        return {normalized}
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+
+def _dedupe_near_duplicates(
+    results: List[Tuple[str, str, Dict, float]],
+    threshold: float = DEDUP_JACCARD_THRESHOLD
+) -> List[Tuple[str, str, Dict, float]]:
+    """
+    Remove near-duplicate chunks, keeping the most similar representative.
+    
+    Greedy over results in similarity order: a chunk is kept only if its
+    shingle Jaccard similarity with every kept chunk is below threshold.
+    Exact Jaccard is used (no MinHash), which is cheap at k=10.
     
-    return filtered
+    Args:
+        results: List of (chunk_id, text, metadata, raw_score) tuples, nearest first
+        threshold: Jaccard similarity (0-1) at or above which a chunk is a duplicate
+        
+    Returns:
+        Deduplicated list of (chunk_id, text, metadata, raw_score) tuples, order preserved
+    """
+    kept = []
+    kept_shingles: List[set] = []
+    for result in results:
+        shingles = _shingles(result[1])
+        if all(
+            len(shingles & other) / len(shingles | other) < threshold
+            for other in kept_shingles
+        ):
+            kept.append(result)
+            kept_shingles.append(shingles)
+    return kept
 
 
 def _check_relevance_llm(doc_content: str, question: str) -> Tuple[bool, float]:
@@ -214,58 +905,91 @@ def _check_relevance_llm(doc_content: str, question: str) -> Tuple[bool, float]:
     return True, 1.0
 
 
-def answer_question(
-    vectordb: Chroma, 
-    question: str,
-    similarity_threshold: Optional[float] = None,
-    use_relevance_filter: bool = False
-) -> Tuple[str, List[Dict], Dict]:
+@lru_cache(maxsize=256)
+def _source_display_name(source_path: Any) -> str:
     """
-    Answer a question using RAG with source citations and similarity scores.
-    
-    RETRIEVAL PIPELINE:
-    1. SIMILARITY SEARCH: Use vector similarity to find semantically similar chunks
-       - This uses embedding space distance (L2 or cosine)
-       - Returns SIMILARITY scores (how similar in meaning, not if it answers the question)
+    Get a short display name for a chunk source.
     
-    2. SIMILARITY FILTERING (optional): Filter low-similarity chunks by threshold
-       - Removes chunks below similarity_threshold
-       - This is a fast, embedding-based filter
+    URLs become domain plus the start of the path; file paths become the filename.
+    Memoized: every chunk of a session shares the same source.
+    """
+    # Handle both file paths and URLs
+    url_match = _URL_RE.match(source_path) if isinstance(source_path, str) else None
+    if url_match:
+        # It's a URL, use domain name plus the start of the path
+        return url_match.group(1) + (url_match.group(2) or '')
+    # It's a file path, extract just the filename
+    return Path(source_path).name if source_path != 'unknown' else 'unknown'
+
+
+def _retrieve(vectordb: Chroma, question: str, k: int) -> List[Tuple[str, str, Dict, float]]:
+    """
+    Retrieve the k nearest chunks for a question.
     
-    3. RELEVANCE FILTERING (optional, future): Use LLM to check if chunks answer the question
-       - This would be a slower but more accurate filter
-       - Currently not implemented (placeholder exists)
+    Uses the cached question embedding and queries the raw Chroma collection
+    directly, skipping LangChain's Document wrapping.
     
     Args:
         vectordb: ChromaDB vector store instance
-        question: The question to answer
-        similarity_threshold: Optional threshold (0.0-1.0) to filter low-similarity chunks.
-                            If None, all retrieved chunks are used. Recommended: 0.3-0.5
-        use_relevance_filter: If True, use LLM-based relevance checking (not yet implemented)
+        question: The question to search for
+        k: Number of chunks to retrieve
         
     Returns:
-        Tuple of (answer, metadata, technical_info)
-        - metadata: List of dicts with chunk_id, source, similarity_score (as percentage), page (if available)
-        - technical_info: Statistics about similarity scores (NOT relevance scores)
+        List of (chunk_id, text, metadata, raw_score) tuples, nearest first
+    """
+    query_result = vectordb._collection.query(
+        query_embeddings=[list(_embed_query(question))],
+        n_results=k,
+        include=["documents", "metadatas", "distances"]
+    )
+    return list(zip(
+        query_result["ids"][0],
+        query_result["documents"][0],
+        query_result["metadatas"][0],
+        query_result["distances"][0]
+    ))
+
+
+def _prepare_answer(
+    vectordb: Chroma, 
+    question: str,
+    similarity_threshold: Optional[float] = None,
+    use_relevance_filter: bool = False,
+    session_id: Optional[str] = None,
+    include_preview: bool = False
+) -> Tuple[str, List[Dict], Dict, str]:
+    """
+    Run retrieval and build the LLM prompt for a question (blocking: embedding + ChromaDB).
+    
+    See answer_question for the retrieval pipeline.
+    
+    Returns:
+        Tuple of (chain_input, metadata, technical_info, retrieval_key); retrieval_key
+        identifies the chunks used and is internal (not part of technical_info)
     """
     # STEP 1: SIMILARITY SEARCH
-    # Use similarity_search_with_score to get documents with SIMILARITY scores
+    # Search by the (cached) question embedding to get documents with SIMILARITY scores
     # These scores represent semantic similarity in embedding space, NOT relevance to the question
-    k = 10  # Retrieve more chunks initially (will be filtered if threshold is set)
-    results = vectordb.similarity_search_with_score(question, k=k)
+    k = RETRIEVAL_K  # Retrieve more chunks initially (will be filtered if threshold is set)
+    results = _retrieve(vectordb, question, k)
+    space = _distance_space(vectordb)
     
-    # Get total chunks in vector store
-    try:
-        collection = vectordb._collection
-        total_chunks = collection.count()
-    except:
-        total_chunks = len(results)
+    # Get total chunks in vector store (cached per session)
+    total_chunks = _CHUNK_COUNTS.get(session_id) if session_id else None
+    if total_chunks is None:
+        try:
+            total_chunks = vectordb._collection.count()
+        except Exception:
+            logger.warning("Could not count chunks for session %s", session_id, exc_info=True)
+            total_chunks = len(results)
+        if session_id:
+            _CHUNK_COUNTS[session_id] = total_chunks
     
     # STEP 2: SIMILARITY FILTERING (optional)
     # Filter out chunks with low similarity scores
     chunks_before_filter = len(results)
     if similarity_threshold is not None:
-        results = _filter_by_similarity_threshold(results, similarity_threshold)
+        results = _filter_by_similarity_threshold(results, similarity_threshold, space)
     chunks_after_similarity_filter = len(results)
     
     # STEP 3: RELEVANCE FILTERING (optional, future enhancement)
@@ -275,68 +999,65 @@ def answer_question(
     if use_relevance_filter:
         # TODO: Implement relevance filtering
         # filtered_results = []
-        # for doc, raw_score in results:
-        #     is_relevant, confidence = _check_relevance_llm(doc.page_content, question)
+        # for chunk_id, text, doc_metadata, raw_score in results:
+        #     is_relevant, confidence = _check_relevance_llm(text, question)
         #     if is_relevant:
-        #         filtered_results.append((doc, raw_score))
+        #         filtered_results.append((chunk_id, text, doc_metadata, raw_score))
         # results = filtered_results
         # chunks_after_relevance_filter = len(results)
         pass
     
+    # STEP 4: NEAR-DUPLICATE REMOVAL
+    # Drop chunks that mostly repeat a higher-similarity chunk (saves prompt tokens)
+    results = _dedupe_near_duplicates(results)
+    chunks_after_dedup = len(results)
+    
     # Build context and metadata from filtered results
-    context = ""
-    metadata = []
+    texts = [text for _, text, _, _ in results]
+    doc_metadatas = [doc_metadata or {} for _, _, doc_metadata, _ in results]
+    source_filenames = [
+        _source_display_name(doc_metadata.get('source', 'unknown')) for doc_metadata in doc_metadatas
+    ]
     
-    for i, (doc, raw_score) in enumerate(results):
-        source_path = doc.metadata.get('source', 'unknown')
-        # Handle both file paths and URLs
-        if isinstance(source_path, str) and (source_path.startswith('http://') or source_path.startswith('https://')):
-            # It's a URL, extract domain name
-            from urllib.parse import urlparse
-            try:
-                parsed_url = urlparse(source_path)
-                source_filename = parsed_url.netloc + (parsed_url.path[:50] if parsed_url.path else '')
-            except:
-                source_filename = source_path[:60]  # Fallback: truncate URL
-        else:
-            # It's a file path, extract just the filename
-            source_filename = Path(source_path).name if source_path != 'unknown' else 'unknown'
-        
-        # Get page number from metadata (if available)
-        page = doc.metadata.get('page', None)
-        
-        # Normalize SIMILARITY score (0-1, then convert to percentage)
-        # IMPORTANT: This is a SIMILARITY score, not a RELEVANCE score
-        similarity_score_normalized = _normalize_similarity_score(raw_score)
-        similarity_score_percentage = round(similarity_score_normalized * 100, 1)  # Convert to percentage
-        
-        context += f"Chunk {i+1} ({source_filename}): {doc.page_content}\n\n"
-        
+    # Normalize SIMILARITY scores (0-1, then convert to percentage) in one pass
+    # IMPORTANT: These are SIMILARITY scores, not RELEVANCE scores
+    similarity_array = np.round(
+        _normalize_similarity_scores([raw_score for _, _, _, raw_score in results], space) * 100, 1
+    )
+    similarity_percentages = similarity_array.tolist()
+    
+    context = "\n\n".join(
+        f"Chunk {i+1} ({source_filename}): {text}"
+        for i, (source_filename, text) in enumerate(zip(source_filenames, texts))
+    )
+    
+    metadata = []
+    for i, (text, doc_metadata) in enumerate(zip(texts, doc_metadatas)):
         # Metadata with clear similarity_score labeling
         meta_item = {
             "chunk_id": i + 1,
-            "source": source_filename,
-            "similarity_score": similarity_score_percentage  # Percentage (0-100), clearly labeled as similarity
+            "source": source_filenames[i],
+            "similarity_score": similarity_percentages[i]  # Percentage (0-100), clearly labeled as similarity
         }
         
         # Add page if available
+        page = doc_metadata.get('page', None)
         if page is not None:
             meta_item["page"] = int(page)
         
-        # Add content preview for reference
-        meta_item["content_preview"] = doc.page_content[:200]
+        # Add content preview for reference (bounded to 200 bytes, not code points)
+        if include_preview:
+            meta_item["content_preview"] = text.encode("utf-8")[:200].decode("utf-8", "ignore")
         
         metadata.append(meta_item)
     
-    # Generate answer using LLM
-    chain_input = prompt.format(context=context, question=question)
-    answer = llm.invoke(chain_input).content
+    chain_input = _render_qa_prompt(context, question)
     
     # Calculate SIMILARITY statistics (NOT relevance statistics)
-    similarity_scores = [meta["similarity_score"] for meta in metadata]
-    avg_similarity = sum(similarity_scores) / len(similarity_scores) if similarity_scores else 0
-    max_similarity = max(similarity_scores) if similarity_scores else 0
-    min_similarity = min(similarity_scores) if similarity_scores else 0
+    has_scores = similarity_array.size > 0
+    avg_similarity = float(similarity_array.mean()) if has_scores else 0
+    max_similarity = float(similarity_array.max()) if has_scores else 0
+    min_similarity = float(similarity_array.min()) if has_scores else 0
     
     # Technical information for RAG query
     # All scores are labeled as SIMILARITY scores (not relevance)
@@ -345,6 +1066,7 @@ def answer_question(
         "chunks_retrieved_initial": chunks_before_filter,
         "chunks_after_similarity_filter": chunks_after_similarity_filter,
         "chunks_after_relevance_filter": chunks_after_relevance_filter,
+        "chunks_after_dedup": chunks_after_dedup,
         "chunks_used_for_answer": len(results),
         "avg_similarity_score": round(avg_similarity, 2),  # Percentage
         "max_similarity_score": round(max_similarity, 2),  # Percentage
@@ -354,14 +1076,234 @@ def answer_question(
         "embedding_model": "text-embedding-3-small",
         "embedding_dimension": 1536,
         "vector_db": "ChromaDB",
-        "similarity_metric": "L2 Distance (normalized to 0-1, displayed as percentage)",
+        "similarity_metric": f"{_DISTANCE_LABELS.get(space, space)} (normalized to 0-1, displayed as percentage)",
         "llm_model": "gpt-4o-mini",
-        "retrieval_method": "similarity_search_with_score"
+        "retrieval_method": "collection.query (query embedding)"
     }
+    retrieval_key = _retrieval_key([chunk_id for chunk_id, _, _, _ in results])
+
+    return chain_input, metadata, technical_info, retrieval_key
+
+
+def _retrieval_key(chunk_ids: List[str]) -> str:
+    """Hash the set of chunk ids a prompt was built from (order-independent)."""
+    return hashlib.blake2b(
+        "\x1f".join(sorted(chunk_ids)).encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+def _generated_answer_key(session_id: str, retrieval_key: str, question: str) -> str:
+    """Hash (session_id, retrieval set, question) into a generated-answer cache key."""
+    raw = "\x1f".join(["answer", _ANSWER_CACHE_NAMESPACE, session_id, retrieval_key, question.strip()])
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+async def _get_cached(key: str) -> Any:
+    """Look up a key in the hot cache, falling back to (and promoting from) disk."""
+    entry = _ANSWER_CACHE_HOT.get(key)
+    if entry is not None:
+        return entry[0]
+    value, expire_at = await run_io(partial(_ANSWER_CACHE_DISK.get, key, expire_time=True))
+    if value is not None:
+        _ANSWER_CACHE_HOT[key] = (value, expire_at)
+    return value
+
+
+async def _set_cached(key: str, value: Any, session_id: str):
+    """Store a value in both cache levels, tagged with its session for eviction."""
+    _ANSWER_CACHE_HOT[key] = (value, time.time() + ANSWER_CACHE_TTL)
+    await run_io(partial(
+        _ANSWER_CACHE_DISK.set, key, value, expire=ANSWER_CACHE_TTL, tag=session_id
+    ))
+
+
+def _answer_cache_key(
+    session_id: str,
+    question: str,
+    similarity_threshold: Optional[float],
+    use_relevance_filter: bool,
+    include_preview: bool
+) -> str:
+    """Hash a question and its retrieval settings into an answer cache key."""
+    raw = "\x1f".join([
+        _ANSWER_CACHE_NAMESPACE,
+        session_id,
+        " ".join(question.lower().split()),
+        repr(similarity_threshold),
+        repr(use_relevance_filter),
+        repr(include_preview),
+        str(RETRIEVAL_K)
+    ])
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _cached_answer(func: Callable) -> Callable:
+    """
+    Cache answer_question results per session in memory (TTL) and on disk.
+    
+    Only applies when a session_id is given; entries are tagged with the
+    session_id so delete_session can evict them.
+    """
+    @wraps(func)
+    async def wrapper(
+        vectordb: Chroma,
+        question: str,
+        similarity_threshold: Optional[float] = None,
+        use_relevance_filter: bool = False,
+        session_id: Optional[str] = None,
+        include_preview: bool = False
+    ) -> Tuple[str, List[Dict], Dict]:
+        args = (vectordb, question, similarity_threshold, use_relevance_filter, session_id, include_preview)
+        if session_id is None:
+            return await func(*args)
+        
+        key = _answer_cache_key(
+            session_id, question, similarity_threshold, use_relevance_filter, include_preview
+        )
+        result = await _get_cached(key)
+        if result is not None:
+            return result
+        
+        result = await func(*args)
+        await _set_cached(key, result, session_id)
+        return result
+    
+    return wrapper
+
+
+@_cached_answer
+async def answer_question(
+    vectordb: Chroma, 
+    question: str,
+    similarity_threshold: Optional[float] = None,
+    use_relevance_filter: bool = False,
+    session_id: Optional[str] = None,
+    include_preview: bool = False
+) -> Tuple[str, List[Dict], Dict]:
+    """
+    Answer a question using RAG with source citations and similarity scores.
+    
+    RETRIEVAL PIPELINE:
+    1. SIMILARITY SEARCH: Use vector similarity to find semantically similar chunks
+       - This uses cosine distance in embedding space
+       - Returns SIMILARITY scores (how similar in meaning, not if it answers the question)
+    
+    2. SIMILARITY FILTERING (optional): Filter low-similarity chunks by threshold
+       - Removes chunks below similarity_threshold
+       - This is a fast, embedding-based filter
+    
+    3. RELEVANCE FILTERING (optional, future): Use LLM to check if chunks answer the question
+       - This would be a slower but more accurate filter
+       - Currently not implemented (placeholder exists)
+    
+    4. NEAR-DUPLICATE REMOVAL: Drop chunks that mostly repeat a better match
+       - Exact shingle Jaccard similarity, threshold 0.8
+    
+    Args:
+        vectordb: ChromaDB vector store instance
+        question: The question to answer
+        similarity_threshold: Optional threshold (0.0-1.0) to filter low-similarity chunks.
+                            If None, all retrieved chunks are used. Recommended: 0.3-0.5
+        use_relevance_filter: If True, use LLM-based relevance checking (not yet implemented)
+        session_id: Optional session UUID, used for the cached chunk count and the answer cache
+        include_preview: If True, add a content_preview (first 200 bytes of UTF-8) to each metadata item
+        
+    Returns:
+        Tuple of (answer, metadata, technical_info)
+        - metadata: List of dicts with chunk_id, source, similarity_score (as percentage), page (if available),
+          content_preview (if include_preview)
+        - technical_info: Statistics about similarity scores (NOT relevance scores)
+    """
+    chain_input, metadata, technical_info, retrieval_key = await _aprepare_answer(
+        vectordb, question, similarity_threshold, use_relevance_filter, session_id, include_preview
+    )
+    
+    # Reuse the generated answer if this question was already asked against
+    # the same retrieved chunks (e.g. with different filter/preview settings)
+    answer_key = None
+    if session_id is not None:
+        answer_key = _generated_answer_key(session_id, retrieval_key, question)
+        answer = await _get_cached(answer_key)
+        if answer is not None:
+            return answer, metadata, technical_info
+    
+    # Generate answer using LLM (same streaming path as /ask/stream, joined)
+    answer = "".join([token async for token in stream_answer(chain_input)])
+    if answer_key is not None:
+        await _set_cached(answer_key, answer, session_id)
 
     return answer, metadata, technical_info
 
 
+async def _aprepare_answer(
+    vectordb: Chroma, 
+    question: str,
+    similarity_threshold: Optional[float] = None,
+    use_relevance_filter: bool = False,
+    session_id: Optional[str] = None,
+    include_preview: bool = False
+) -> Tuple[str, List[Dict], Dict, str]:
+    """
+    Run _prepare_answer off the event loop.
+    
+    Retrieval is serialized per session; LLM generation (done by the caller)
+    is not, so concurrent questions on one session only queue for retrieval.
+    The session's handle is re-resolved under the session lock, which keeps it
+    from being evicted until retrieval is done.
+    
+    Returns:
+        Tuple of (chain_input, metadata, technical_info, retrieval_key)
+    """
+    if session_id is None:
+        return await run_io(
+            _prepare_answer, vectordb, question, similarity_threshold, use_relevance_filter,
+            session_id, include_preview
+        )
+    async with _session_lock(session_id):
+        # The handle passed in may have been evicted (and its System stopped) while
+        # the caller awaited; a cache hit here is just a dict lookup
+        vectordb = await run_io(load_vectordb, session_id) or vectordb
+        return await run_io(
+            _prepare_answer, vectordb, question, similarity_threshold, use_relevance_filter,
+            session_id, include_preview
+        )
+
+
+async def prepare_answer(
+    vectordb: Chroma, 
+    question: str,
+    similarity_threshold: Optional[float] = None,
+    use_relevance_filter: bool = False,
+    session_id: Optional[str] = None,
+    include_preview: bool = False
+) -> Tuple[str, List[Dict], Dict]:
+    """
+    Run retrieval off the event loop and build the LLM prompt for a question.
+    
+    Returns:
+        Tuple of (chain_input, metadata, technical_info)
+    """
+    chain_input, metadata, technical_info, _ = await _aprepare_answer(
+        vectordb, question, similarity_threshold, use_relevance_filter, session_id, include_preview
+    )
+    return chain_input, metadata, technical_info
+
+
+async def stream_answer(chain_input: str) -> AsyncIterator[str]:
+    """
+    Stream the LLM answer for a prepared prompt token by token.
+    
+    Args:
+        chain_input: Prompt returned by prepare_answer
+        
+    Yields:
+        Answer text fragments as they are generated
+    """
+    async for chunk in llm.astream(chain_input):
+        if chunk.content:
+            yield chunk.content
+
+
 def get_session_technical_info(session_id: str) -> Optional[Dict]:
     """
     Get technical information about a session.
@@ -373,33 +1315,43 @@ def get_session_technical_info(session_id: str) -> Optional[Dict]:
         Dictionary with technical information or None
     """
     vecdb_path = VECDB_DIR / session_id
-    if not vecdb_path.exists():
+    if session_id in _RESERVED_DIRS or not vecdb_path.exists():
         return None
     
-    try:
-        vectordb = Chroma(
-            persist_directory=str(vecdb_path),
-            embedding_function=embeddings
-        )
-        
-        # Get collection info
-        collection = vectordb._collection
-        total_chunks = collection.count()
-        
-        # Try to get sample metadata
+    # Sessions store their ingest-time info; only legacy sessions need the collection
+    info_path = vecdb_path / SESSION_INFO_FILE
+    if info_path.exists():
         try:
-            results = collection.peek(limit=1)
-            if results and results.get('metadatas') and len(results['metadatas']) > 0:
-                sample_meta = results['metadatas'][0]
-                source = sample_meta.get('source', 'unknown')
-                source_type = "URL" if (isinstance(source, str) and 
-                                        (source.startswith('http://') or source.startswith('https://'))) else "PDF"
-            else:
+            return {"session_id": session_id, **json.loads(info_path.read_text())}
+        except (OSError, ValueError) as e:
+            logger.warning("Error reading session info for %s: %s", session_id, e)
+    
+    # Legacy sessions: read the collection while holding _VDB_CACHE_LOCK so the
+    # handle can't be evicted (and its System stopped) mid-read
+    try:
+        with _VDB_CACHE_LOCK:
+            vectordb = load_vectordb(session_id)
+            if vectordb is None:
+                return None
+            
+            # Get collection info
+            collection = vectordb._collection
+            total_chunks = collection.count()
+            
+            # Try to get sample metadata
+            try:
+                results = collection.peek(limit=1)
+                if results and results.get('metadatas') and len(results['metadatas']) > 0:
+                    sample_meta = results['metadatas'][0]
+                    source = sample_meta.get('source', 'unknown')
+                    source_type = "URL" if (isinstance(source, str) and _URL_RE.match(source)) else "PDF"
+                else:
+                    source_type = "Unknown"
+                    source = "unknown"
+            except Exception:
+                logger.warning("Could not peek collection for session %s", session_id, exc_info=True)
                 source_type = "Unknown"
                 source = "unknown"
-        except:
-            source_type = "Unknown"
-            source = "unknown"
         
         return {
             "session_id": session_id,
@@ -410,14 +1362,14 @@ def get_session_technical_info(session_id: str) -> Optional[Dict]:
             "source_type": source_type,
             "source": source[:100] if isinstance(source, str) else str(source)[:100]
         }
-    except Exception as e:
-        print(f"Error getting session info: {e}")
+    except Exception:
+        logger.exception("Error getting session info for %s", session_id)
         return None
 
 
 def load_vectordb(session_id: str) -> Optional[Chroma]:
     """
-    Load an existing vector store by session ID.
+    Load an existing vector store by session ID (served from an LRU of open handles).
     
     Args:
         session_id: The session UUID
@@ -425,19 +1377,26 @@ def load_vectordb(session_id: str) -> Optional[Chroma]:
     Returns:
         ChromaDB instance or None if not found
     """
-    vecdb_path = VECDB_DIR / session_id
-    if not vecdb_path.exists():
-        return None
-    
-    try:
-        vectordb = Chroma(
-            persist_directory=str(vecdb_path),
-            embedding_function=embeddings
-        )
-        return vectordb
-    except Exception as e:
-        print(f"Error loading vectordb: {e}")
-        return None
+    with _VDB_CACHE_LOCK:
+        vectordb = _VDB_CACHE.get(session_id)
+        if vectordb is not None:
+            _VDB_CACHE.move_to_end(session_id)
+            return vectordb
+        
+        vecdb_path = VECDB_DIR / session_id
+        if session_id in _RESERVED_DIRS or not vecdb_path.exists():
+            return None
+        
+        try:
+            vectordb = Chroma(
+                persist_directory=str(vecdb_path),
+                embedding_function=cached_embeddings
+            )
+            _cache_vectordb(session_id, vectordb)
+            return vectordb
+        except Exception:
+            logger.exception("Error loading vectordb for %s", session_id)
+            return None
 
 
 def delete_session(session_id: str):
@@ -447,9 +1406,13 @@ def delete_session(session_id: str):
     Args:
         session_id: The session UUID to delete
     """
+    _CHUNK_COUNTS.pop(session_id, None)
+    _ANSWER_CACHE_DISK.evict(session_id)
+    with _VDB_CACHE_LOCK:
+        _VDB_CACHE.pop(session_id, None)
+        _release_session_system(session_id)
     vecdb_path = VECDB_DIR / session_id
-    if vecdb_path.exists():
-        import shutil
+    if session_id not in _RESERVED_DIRS and vecdb_path.exists():
         shutil.rmtree(vecdb_path)
 
 
@@ -463,15 +1426,15 @@ def get_all_sessions() -> List[str]:
     if not VECDB_DIR.exists():
         return []
     
-    sessions = []
-    for path in VECDB_DIR.iterdir():
-        if path.is_dir():
-            sessions.append(path.name)
-    
-    return sessions
+    # scandir entries carry the file type from readdir, so no extra stat per entry
+    with os.scandir(VECDB_DIR) as entries:
+        return [
+            entry.name for entry in entries
+            if entry.is_dir(follow_symlinks=False) and entry.name not in _RESERVED_DIRS
+        ]
 
 
-def ingest_url(url: str) -> Tuple[str, Chroma, str, Dict]:
+async def aingest_url(url: str) -> Tuple[str, Chroma, str, Dict]:
     """
     Process a web URL, generate summary with citations, and create a session-based vector store.
     
@@ -482,40 +1445,20 @@ def ingest_url(url: str) -> Tuple[str, Chroma, str, Dict]:
         Tuple of (session_id, vectordb, summary, technical_info)
     """
     try:
-        # Load web content using LangChain's WebBaseLoader
-        loader = WebBaseLoader(url)
-        docs = loader.load()
+        # Load web content over the pooled HTTP client
+        docs = await _load_url(url)
         
         if not docs:
             raise Exception("No content extracted from URL")
         
-        # Combine all documents into one text for summary
-        full_text = "\n\n".join([doc.page_content for doc in docs])
+        # Summarize from the start of the page text (_load_url returns one Document)
+        summary_text = docs[0].page_content[:SUMMARY_INPUT_CHARS]
         
         # Generate summary with source citation
-        summary_with_citation_prompt = PromptTemplate(
-            template="""
-Summarize the following web content in a clear and concise manner.
-Focus on the main points, key information, and important details.
-Include source citations in the format [Source: {url}] at the end of each major point.
-
-Content:
-{content}
-
-Provide a comprehensive summary with source citations:
-""",
-            input_variables=["content", "url"]
-        )
-        
-        summary_input = summary_with_citation_prompt.format(content=full_text[:8000], url=url)
-        summary = llm.invoke(summary_input).content
+        summary_input = summary_with_citation_prompt.format(content=summary_text, url=url)
         
         # Split documents into chunks
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800,
-            chunk_overlap=200
-        )
-        chunks = splitter.split_documents(docs)
+        chunks = await run_cpu(_SPLITTER.split_documents, docs)
         
         # Add URL as source metadata to each chunk
         for chunk in chunks:
@@ -527,19 +1470,30 @@ Provide a comprehensive summary with source citations:
         total_chars = sum(len(chunk.page_content) for chunk in chunks)
         avg_chunk_size = total_chars / len(chunks) if chunks else 0
         
-        # Create vector store
+        # Generate summary and create vector store concurrently
         session_id = str(uuid.uuid4())
-        vectordb = Chroma.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            persist_directory=str(VECDB_DIR / session_id)
-        )
+        tasks = [
+            asyncio.ensure_future(llm.ainvoke(summary_input)),
+            asyncio.ensure_future(_abuild_vectordb(chunks, session_id))
+        ]
+        try:
+            summary_message, vectordb = await asyncio.gather(*tasks)
+        except BaseException:
+            # One side failed (or we were cancelled): stop the other and drop any
+            # partially built store so no orphan session is left behind
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await run_io(delete_session, session_id)
+            raise
+        summary = summary_message.content
+        _CHUNK_COUNTS[session_id] = len(chunks)
         
         # Technical information
         technical_info = {
             "num_chunks": len(chunks),
-            "chunk_size": 800,
-            "chunk_overlap": 200,
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP,
             "total_characters": total_chars,
             "avg_chunk_size": round(avg_chunk_size, 2),
             "embedding_model": "text-embedding-3-small",
@@ -548,8 +1502,24 @@ Provide a comprehensive summary with source citations:
             "source_type": "URL",
             "source": url
         }
+        await run_io(_save_session_info, session_id, technical_info)
         
         return session_id, vectordb, summary, technical_info
         
+    except BlockedURLError:
+        raise
     except Exception as e:
         raise Exception(f"Error processing URL: {str(e)}")
+
+
+def ingest_url(url: str) -> Tuple[str, Chroma, str, Dict]:
+    """
+    Synchronous wrapper around aingest_url (for use outside an event loop).
+    
+    Args:
+        url: Web URL to process
+        
+    Returns:
+        Tuple of (session_id, vectordb, summary, technical_info)
+    """
+    return asyncio.run(aingest_url(url))